@@ -14,6 +14,8 @@
 
 import json
 
+import numpy as np
+
 CUTOFF_INPUT = 1024
 CUTOFF_OUTPUT = 1024
 
@@ -22,9 +24,6 @@ CUTOFF_OUTPUT = 1024
 def do_simulation(
     sharegpt_path, prefill_bucket_size_to_ms, system_time_per_decode_token_ms
 ):
-  def next_power_of_2(x):
-    return 1 if x == 0 else 2 ** (x - 1).bit_length()
-
   def tokens_in_input_str(s):
     return_val = int(1.3 * len(s.split()))
     # print(f"{s=} -> {return_val=}")
@@ -43,38 +42,40 @@ def do_simulation(
     convo_numbers.append((input_tokens, output_tokens))
 
   num_convos = len(convo_numbers)
-  kept_convos = [
-      c for c in convo_numbers if c[0] <= CUTOFF_INPUT and c[1] <= CUTOFF_OUTPUT
+  convo_numbers = np.array(convo_numbers, dtype=np.int64)
+  kept_convos = convo_numbers[
+      (convo_numbers[:, 0] <= CUTOFF_INPUT)
+      & (convo_numbers[:, 1] <= CUTOFF_OUTPUT)
   ]
+  input_toks, output_toks = kept_convos[:, 0], kept_convos[:, 1]
 
-  mean_input = sum(c[0] for c in kept_convos) / len(kept_convos)
-  mean_output = sum(c[1] for c in kept_convos) / len(kept_convos)
+  mean_input = input_toks.mean()
+  mean_output = output_toks.mean()
 
   print(
-      f"""Total {num_convos=} but only kept {kept_convos=}. 
+      f"""Total {num_convos=} but only kept {len(kept_convos)=}.
     Out of kept, {mean_input=}, {mean_output=}"""
   )
 
-  total_prefill_system_ms = 0
-  total_generate_system_ms = 0
-
-  for convo in kept_convos:
-    input_tok, output_tok = convo
-    bucket = max(128, next_power_of_2(input_tok))
-    generate_system_ms = output_tok * system_time_per_decode_token_ms
-    prefill_system_ms = prefill_bucket_size_to_ms[bucket]
-
-    print(
-        f"{convo=} {bucket=}, {prefill_system_ms=:.2f}, {generate_system_ms=:.2f}"
-    )
+  # next_power_of_2, clamped to a minimum bucket of 128, vectorized.
+  buckets = np.maximum(
+      128, 2 ** np.ceil(np.log2(np.maximum(input_toks, 1))).astype(np.int64)
+  )
+  # log2-indexed lookup table: bucket b lives at lut[log2(b)], so mapping
+  # every conversation to its prefill cost is a single gather.
+  prefill_ms_lut = np.zeros(int(np.log2(max(prefill_bucket_size_to_ms))) + 1)
+  for bucket, ms in prefill_bucket_size_to_ms.items():
+    prefill_ms_lut[int(np.log2(bucket))] = ms
+  prefill_system_ms = prefill_ms_lut[np.log2(buckets).astype(np.int64)]
+  generate_system_ms = output_toks * system_time_per_decode_token_ms
 
-    total_prefill_system_ms += prefill_system_ms
-    total_generate_system_ms += generate_system_ms
+  total_prefill_system_ms = prefill_system_ms.sum()
+  total_generate_system_ms = generate_system_ms.sum()
 
   total_time_ms = total_prefill_system_ms + total_generate_system_ms
-  input_tokens = sum(c[0] for c in kept_convos)
+  input_tokens = input_toks.sum()
 
-  output_tokens = sum(c[1] for c in kept_convos)
+  output_tokens = output_toks.sum()
   print(
       f"""Output tokens {output_tokens} in {total_time_ms/1000:.2f} seconds, 
       for {output_tokens/(total_time_ms/1000):.2f} out tok/s"""
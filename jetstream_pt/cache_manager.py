@@ -104,10 +104,22 @@ class KVCacheGenerate:
     """Update kv cache"""
     keyj, valuej = torchjax.to_torch((key, value))
     if self.env.ring_buffer:
-      # pylint: disable-next=all
-      self.cache_k._elem = self.cache_k._elem.at[:, :, self.pos].set(keyj)
-      # pylint: disable-next=all
-      self.cache_v._elem = self.cache_v._elem.at[:, :, self.pos].set(valuej)
+      # Ring buffer writes are contiguous in the sequence dim, so use
+      # dynamic_update_slice, which XLA lowers to an in-place update,
+      # instead of the one-hot scatter produced by indexed assignment.
+      # Wrap the position explicitly: scatter drops out-of-bound writes
+      # (e.g. the first step after prefill when starting_position exceeds
+      # the cache length) while dynamic_update_slice clamps; the wrapped
+      # slot is masked so attention output is unchanged.
+      pos = jnp.asarray(self.pos).reshape(-1)[0] % self.cache_k.shape[2]
+      # pylint: disable=protected-access
+      self.cache_k._elem = jax.lax.dynamic_update_slice(
+          self.cache_k._elem, keyj._elem, (0, 0, pos, 0)
+      )
+      self.cache_v._elem = jax.lax.dynamic_update_slice(
+          self.cache_v._elem, valuej._elem, (0, 0, pos, 0)
+      )
+      # pylint: enable=protected-access
     else:
       batch = jnp.arange(self.env.batch_size)
       # pylint: disable-next=all
@@ -76,6 +76,12 @@ flags.DEFINE_bool(
     "Whether to enable Ragged multi head attention",
     required=False,
 )
+flags.DEFINE_bool(
+    "fused_swiglu",
+    False,
+    "Whether to compute MoE gate/up projections with the fused swiglu kernel",
+    required=False,
+)
 flags.DEFINE_integer(
     "starting_position",
     512,
@@ -176,6 +182,7 @@ def create_engine_from_config_flags():
       sharding_config=sharding_file_name,
       shard_on_batch=FLAGS.shard_on_batch,
       ragged_mha=FLAGS.ragged_mha,
+      fused_swiglu=FLAGS.fused_swiglu,
       starting_position=FLAGS.starting_position,
       temperature=FLAGS.temperature,
       sampling_algorithm=FLAGS.sampling_algorithm,
@@ -198,7 +198,11 @@ class PyTorchEngine(engine_api.Engine):
       jax.jit,
       static_argnums=(0,),
   )
-  def _call_model_prefill(self, weights, tokens, input_indexes):
+  def _call_model_prefill(self, weights, tokens):
+    # Prefill positions are always [0, seqlen). Computing them inside the
+    # jitted function makes them compile-time constants, so XLA folds the
+    # freqs_cis / mask gathers into static slices instead of dynamic gathers.
+    input_indexes = jnp.arange(0, tokens.shape[1])
     caches = [
         cache_manager.KVCachePrefill(
             self.env.quant_config.enable_kv_quantization
@@ -251,12 +255,18 @@ class PyTorchEngine(engine_api.Engine):
           "Input tokens should be of type Jax Array, but receiving:"
           " {prefill_inputs}"
       )
-    seq_len = padded_tokens.shape[0]
-    input_indexes = jnp.arange(0, seq_len)
+    seq_len = batched_token.shape[1]
+    # Pad to the next power of two (min 16) so arbitrary input lengths map
+    # onto O(log max_input) compiled prefill programs instead of one per
+    # unique length. true_length keeps sampling at the real last token.
+    bucket_len = max(16, 1 << (seq_len - 1).bit_length())
+    if bucket_len != seq_len:
+      batched_token = jnp.pad(
+          batched_token, ((0, 0), (0, bucket_len - seq_len))
+      )
     logits, updated_caches = self._call_model_prefill(
         params,
         batched_token,
-        input_indexes,
     )
     if len(logits.shape) == 3:  # b, seqlen, num words
       logits = logits[0]  # seqlen, num words
@@ -802,6 +812,7 @@ def create_pytorch_engine(
     sharding_config=None,
     shard_on_batch=False,
     ragged_mha=False,
+    fused_swiglu=False,
     starting_position=512,
     temperature=None,
     sampling_algorithm="greedy",
@@ -821,6 +832,14 @@ def create_pytorch_engine(
   # Pytorch exports has int64 constants.
   # jax.config.update('jax_enable_x64', True)
   jax.config.update("jax_traceback_filtering", "off")
+  # Persist compiled programs on disk so restarting the server skips XLA
+  # compilation of the prefill buckets and the decode program.
+  jax.config.update(
+      "jax_compilation_cache_dir",
+      os.environ.get("JAX_COMPILATION_CACHE_DIR", "/tmp/jax_cache"),
+  )
+  jax.config.update("jax_persistent_cache_min_entry_size_bytes", 0)
+  jax.config.update("jax_persistent_cache_min_compile_time_secs", 1)
   torch_dtype = torch.bfloat16 if bf16_enable else torch.float32
   torch.set_default_dtype(torch_dtype)
   checkpoint_format = ""
@@ -872,6 +891,7 @@ def create_pytorch_engine(
       sharding_config_path=sharding_config,
       shard_on_batch=shard_on_batch,
       ragged_mha=ragged_mha,
+      fused_swiglu=fused_swiglu,
       starting_position=starting_position,
       temperature=temperature,
       sampling_algorithm=sampling_algorithm,
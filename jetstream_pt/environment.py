@@ -97,6 +97,10 @@ class JetEngineEnvironmentData:
   # The block size for the ragged attention.
   block_size: int = 512
 
+  # Whether to compute the MoE gate/up projections with the fused
+  # swiglu Pallas kernel.
+  fused_swiglu: bool = False
+
   # Starting position
   starting_position: int = 512
 
@@ -128,6 +132,7 @@ class JetEngineEnvironment:
     self.cache_len = self._data.cache_sequence_length
     self.ragged_mha = self._data.ragged_mha
     self.block_size = self._data.block_size
+    self.fused_swiglu = self._data.fused_swiglu
     self.starting_position = self._data.starting_position
     self.ring_buffer = self._data.ring_buffer
     P = jax.sharding.PartitionSpec
@@ -310,25 +310,43 @@ class RMSNorm(torch.nn.Module):
     self.weight = nn.Parameter(torch.ones(dim, device=device))
 
   def _norm(self, x):
-    return x * torch.rsqrt(x.pow(2).mean(-1, keepdim=True) + self.eps)
+    # Accumulate the variance in float32 but keep the scaling multiply in
+    # the activation dtype; upcasting x for the whole norm doubles the
+    # bytes read by this memory-bound op.
+    var = x.float().pow(2).mean(-1, keepdim=True)
+    return x * torch.rsqrt(var + self.eps).type_as(x)
 
   def forward(self, x: torch.Tensor) -> torch.Tensor:
-    output = self._norm(x.float()).type_as(x)
+    output = self._norm(x)
     return output * self.weight
 
+  def forward_add(self, x: torch.Tensor, residual: torch.Tensor):
+    """Computes h = x + residual and norm(h) in one pass; returns both.
+
+    Keeping the add and the norm together lets XLA fuse them into a
+    single elementwise kernel, so h is not re-read for the residual.
+    """
+    h = x + residual
+    return h, self._norm(h) * self.weight
+
 
 def reshape_for_broadcast(
     freqs_cis: torch.Tensor, x: torch.Tensor
 ) -> torch.Tensor:
   ndim = x.ndim
   assert 1 < ndim
-  assert freqs_cis.shape == (
-      x.shape[0],
-      x.shape[-3],
-      x.shape[-1],
+  # A size-1 batch dim broadcasts across the batch at the multiply.
+  bs = freqs_cis.shape[0]
+  assert bs in (1, x.shape[0]) and freqs_cis.shape == (
+      bs,
+      x.shape[-4],
+      x.shape[-2],
+      2,
   ), f"freqs_cis: {freqs_cis.shape }, x: {x.shape}"
-  shape = [d if i == 1 or i == ndim - 1 else 1 for i, d in enumerate(x.shape)]
-  shape[0] = x.shape[0]  # batch size
+  shape = [
+      d if i in (1, ndim - 2, ndim - 1) else 1 for i, d in enumerate(x.shape)
+  ]
+  shape[0] = bs
   return freqs_cis.view(*shape)
 
 
@@ -338,11 +356,27 @@ def apply_rotary_emb(
     freqs_cis: torch.Tensor,
 ) -> Tuple[torch.Tensor, torch.Tensor]:
   # bs, seqlen, heads, dim
-  xq_ = torch.view_as_complex(xq.float().reshape(*xq.shape[:-1], -1, 2))
-  xk_ = torch.view_as_complex(xk.float().reshape(*xk.shape[:-1], -1, 2))
+  # freqs_cis stacks (cos, sin) in its last dim; rotating real pairs keeps
+  # RoPE as plain multiplies and adds that XLA fuses, instead of a complex
+  # multiply that lowers poorly on TPU.
+  xq_ = xq.float().reshape(*xq.shape[:-1], -1, 2)
+  xk_ = xk.float().reshape(*xk.shape[:-1], -1, 2)
   freqs_cis = reshape_for_broadcast(freqs_cis, xq_)
-  xq_out = torch.view_as_real(xq_ * freqs_cis).flatten(3)
-  xk_out = torch.view_as_real(xk_ * freqs_cis).flatten(3)
+  cos, sin = freqs_cis[..., 0], freqs_cis[..., 1]
+  xq_out = torch.stack(
+      (
+          xq_[..., 0] * cos - xq_[..., 1] * sin,
+          xq_[..., 0] * sin + xq_[..., 1] * cos,
+      ),
+      dim=-1,
+  ).flatten(3)
+  xk_out = torch.stack(
+      (
+          xk_[..., 0] * cos - xk_[..., 1] * sin,
+          xk_[..., 0] * sin + xk_[..., 1] * cos,
+      ),
+      dim=-1,
+  ).flatten(3)
   return xq_out.type_as(xq), xk_out.type_as(xk)
 
 
@@ -585,6 +619,9 @@ class Attention(nn.Module):
       ragged_batch_index=None,
       ragged_block_index=None,
   ):
+    if freqs_cis.ndim == 3:
+      # Unbatched (seqlen, head_dim / 2, 2) table; broadcast over batch.
+      freqs_cis = freqs_cis.unsqueeze(0)
     with jax.named_scope("attn_linear_before_cache"):
       bsz, seqlen = x.shape[0], x.shape[-2]
 
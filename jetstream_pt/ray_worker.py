@@ -234,7 +234,7 @@ class PyTorchRayWorker:
 
     self._compiled_call_model_prefill = jax.jit(
         self._call_model_prefill,
-        donate_argnums=(1, 2),
+        donate_argnums=(1,),
         out_shardings=(self.replicated, self.cache_sharding),
     )
     self._compiled_insert = jax.jit(
@@ -393,7 +393,11 @@ class PyTorchRayWorker:
       jax.jit,
       static_argnums=(0,),
   )
-  def _call_model_prefill(self, weights, tokens, input_indexes):
+  def _call_model_prefill(self, weights, tokens):
+    # Prefill positions are always [0, seqlen). Computing them inside the
+    # jitted function makes them compile-time constants, so XLA folds the
+    # freqs_cis / mask gathers into static slices instead of dynamic gathers.
+    input_indexes = jnp.arange(0, tokens.shape[1])
     caches = [
         cache_manager.KVCachePrefill(
             self.env.quant_config.enable_kv_quantization
@@ -441,12 +445,9 @@ class PyTorchRayWorker:
           "Input tokens should be of type Jax Array, but receiving:"
           " {padded_tokens}"
       )
-    seq_len = padded_tokens.shape[0]
-    input_indexes = jnp.arange(0, seq_len)
     logits, updated_caches = self._compiled_call_model_prefill(
         self.params,
         batched_token,
-        input_indexes,
     )
 
     logits = multihost_utils.process_allgather(logits, tiled=True)
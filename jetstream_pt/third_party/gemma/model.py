@@ -13,10 +13,12 @@
 # limitations under the License.
 """Inference-only Gemma model implementation."""
 
+import functools
+from typing import Any, List
+
 import torch
 from torch import nn
 import torch.nn.functional as F
-from typing import Any, List
 
 from . import config as gemma_config
 
@@ -24,14 +26,21 @@ from jetstream_pt import layers
 import jax
 
 
+@functools.lru_cache(maxsize=8)
 def precompute_freqs_cis(
     dim: int, end: int, theta: float = 10000.0
 ) -> torch.Tensor:
-  """Precomputes the frequency cis."""
+  """Precomputes the frequency cis.
+
+  Memoized so sibling model instances in one process (e.g. per-shard
+  replicas) share a single table; callers treat it as read-only.
+  """
   freqs = 1.0 / (theta ** (torch.arange(0, dim, 2)[: (dim // 2)].float() / dim))
   t = torch.arange(end, device=freqs.device)
   freqs = torch.outer(t, freqs).float()
-  freqs_cis = torch.polar(torch.ones_like(freqs), freqs)  # complex64
+  # Stacked real (cos, sin) pairs; complex64 would force complex lowering
+  # at the RoPE site.
+  freqs_cis = torch.stack((freqs.cos(), freqs.sin()), dim=-1)
   return freqs_cis
 
 
@@ -40,22 +49,31 @@ def reshape_for_broadcast(
 ) -> torch.Tensor:
   ndim = x.ndim
   assert 1 < ndim
-  assert freqs_cis.shape == (
-      x.shape[0],
+  # A size-1 batch dim broadcasts across the batch at the multiply.
+  bs = freqs_cis.shape[0]
+  assert bs in (1, x.shape[0]) and freqs_cis.shape == (
+      bs,
       x.shape[2],
       x.shape[3],
+      2,
   ), f"freqs_cis: {freqs_cis.shape }, x: {x.shape}"
   shape = [d if i != 1 else 1 for i, d in enumerate(x.shape)]
+  shape[0] = bs
   return freqs_cis.view(*shape)
 
 
 def apply_rotary_emb(x: torch.Tensor, freqs_cis: torch.Tensor) -> torch.Tensor:
   """Applies the rotary embedding to the query and key tensors."""
-  x_ = torch.view_as_complex(
-      torch.stack(torch.chunk(x.transpose(1, 2).float(), 2, dim=-1), dim=-1)
-  )
+  x_ = torch.stack(torch.chunk(x.transpose(1, 2).float(), 2, dim=-1), dim=-1)
   freqs_cis = reshape_for_broadcast(freqs_cis, x_)
-  x_out = torch.view_as_real(x_ * freqs_cis).type_as(x)
+  cos, sin = freqs_cis[..., 0], freqs_cis[..., 1]
+  x_out = torch.stack(
+      (
+          x_[..., 0] * cos - x_[..., 1] * sin,
+          x_[..., 0] * sin + x_[..., 1] * cos,
+      ),
+      dim=-1,
+  ).type_as(x)
   x_out = torch.cat(torch.chunk(x_out, 2, dim=-1), dim=-2)
   x_out = x_out.reshape(
       x_out.shape[0], x_out.shape[1], x_out.shape[2], -1
@@ -148,6 +166,9 @@ class GemmaAttention(nn.Module):
       ragged_batch_index=None,
       ragged_block_index=None,
   ) -> torch.Tensor:
+    if freqs_cis.ndim == 3:
+      # Unbatched (seqlen, head_dim / 2, 2) table; broadcast over batch.
+      freqs_cis = freqs_cis.unsqueeze(0)
     hidden_states_shape = hidden_states.shape
     assert len(hidden_states_shape) == 3
     batch_size, input_len, _ = hidden_states_shape
@@ -209,10 +230,13 @@ class RMSNorm(torch.nn.Module):
     self.weight = nn.Parameter(torch.zeros(dim, device=device))
 
   def _norm(self, x):
-    return x * torch.rsqrt(x.pow(2).mean(-1, keepdim=True) + self.eps)
+    # Only the variance accumulation needs float32; the scaling multiply
+    # stays in the activation dtype to avoid reading x twice at full width.
+    var = x.float().pow(2).mean(-1, keepdim=True)
+    return x * torch.rsqrt(var + self.eps).type_as(x)
 
   def forward(self, x):
-    x = self._norm(x.float()).type_as(x)
+    x = self._norm(x)
     if self.add_unit_offset:
       output = x * (1 + self.weight)
     else:
@@ -358,6 +382,10 @@ class GemmaModel(nn.Module):
     freqs_cis = precompute_freqs_cis(
         config.head_dim, config.max_position_embeddings * 2, theta=rope_theta
     )
+    if env.bf16_enable:
+      # Halves the bytes read from HBM when gathering the RoPE table; the
+      # rotation itself still accumulates in float32.
+      freqs_cis = freqs_cis.to(torch.bfloat16)
     self.register_buffer("freqs_cis", freqs_cis)
 
   @torch.no_grad()
@@ -384,7 +412,7 @@ class GemmaModel(nn.Module):
     with jax.named_scope("transformer_freq"):
       bsz, seqlen = tokens.shape
       freqs_cis = self.freqs_cis[input_pos]
-      freqs_cis = freqs_cis.reshape(bsz, seqlen, -1)
+      freqs_cis = freqs_cis.reshape(bsz, seqlen, -1, 2)
 
     hidden_states = self.embedder(tokens)
     hidden_states = hidden_states * (self.config.hidden_size**0.5)
@@ -1,6 +1,7 @@
 # pylint: disable-all
 """This version contains modification to make it easier to trace and support batch."""
 
+import functools
 from typing import Any, List, Optional
 
 import jax
@@ -132,21 +133,25 @@ class TransformerBlock(nn.Module):
           ragged_block_index,
       )
     with jax.named_scope("ffn_norm"):
-      h = x + attn
-      ffns = self.ffn_norm(h)
+      h, ffns = self.ffn_norm.forward_add(x, attn)
 
     with jax.named_scope("ffn"):
       out = h + self.feed_forward.forward(ffns)
       return out
 
 
+@functools.lru_cache(maxsize=8)
 def precompute_freqs_cis(
     dim: int, end: int, theta: float = 10000.0
 ) -> torch.Tensor:
+  # Memoized so sibling model instances in one process (e.g. per-shard
+  # replicas) share a single table; callers treat it as read-only.
   freqs = 1.0 / (theta ** (torch.arange(0, dim, 2)[: (dim // 2)].float() / dim))
   t = torch.arange(end, device=freqs.device)  # type: ignore
   freqs = torch.outer(t, freqs).float()  # type: ignore
-  freqs_cis = torch.polar(torch.ones_like(freqs), freqs)  # complex64
+  # Stacked real (cos, sin) pairs; complex64 would force complex lowering
+  # at the RoPE site.
+  freqs_cis = torch.stack((freqs.cos(), freqs.sin()), dim=-1)
   return freqs_cis
 
 
@@ -194,6 +199,10 @@ class Transformer(nn.Module):
         self.params.max_seq_len * 2,
         theta=self.params.rope_theta,
     )
+    if env.bf16_enable:
+      # Halves the bytes read from HBM when gathering the RoPE table; the
+      # rotation itself still accumulates in float32.
+      freqs_cis = freqs_cis.to(torch.bfloat16)
 
     self.register_buffer("freqs_cis", freqs_cis)
 
@@ -225,7 +234,7 @@ class Transformer(nn.Module):
     with jax.named_scope("transformer_freq"):
       bsz, seqlen = tokens.shape
       freqs_cis = self.freqs_cis[input_pos]
-      freqs_cis = freqs_cis.reshape(bsz, seqlen, -1)
+      freqs_cis = freqs_cis.reshape(bsz, seqlen, -1, 2)
 
     assert len(caches) == len(
         self.layers
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 from dataclasses import dataclass
 from typing import Optional, List, Any
 
@@ -21,9 +22,11 @@ import torch.nn as nn
 from torch import Tensor
 from torch.nn import functional as F
 from .config import ModelArgs, find_multiple
+from jetstream_pt import swiglu_kernel
 from jetstream_pt.layers import Attention, get_quantized_linear_layer, get_quantized_enbedding_layer
 
 import jax
+from jetstream_pt import torchjax
 
 
 class Transformer(nn.Module):
@@ -55,6 +58,10 @@ class Transformer(nn.Module):
         self.config.dim // self.config.n_head,
         self.config.rope_base,
     )
+    if env.bf16_enable:
+      # Halves the bytes read from HBM when gathering the RoPE table; the
+      # rotation itself still accumulates in float32.
+      freqs_cis = freqs_cis.to(torch.bfloat16)
     self.register_buffer("freqs_cis", freqs_cis)
 
   @torch.no_grad()
@@ -75,7 +82,7 @@ class Transformer(nn.Module):
     with jax.named_scope("transformer_freq"):
       bsz, seqlen = idx.shape
       freqs_cis = self.freqs_cis[input_pos]
-      freqs_cis = freqs_cis.reshape(bsz, seqlen, -1)
+      freqs_cis = freqs_cis.reshape(bsz, seqlen, -1, 2)
     assert len(caches) == len(
         self.layers
     ), f"Number of caches ({len(caches)}) and layers ({len(self.layers)}) dont match"
@@ -179,8 +186,7 @@ class TransformerBlock(nn.Module):
           ragged_block_index,
       )
     with jax.named_scope("ffn_norm"):
-      h = x + attn
-      ffns = self.ffn_norm(h)
+      h, ffns = self.ffn_norm.forward_add(x, attn)
     with jax.named_scope("ffn"):
       moe = self.block_sparse_moe(ffns)
       out = h + moe
@@ -189,8 +195,9 @@ class TransformerBlock(nn.Module):
 
 class Int8ConditionalFeedForward(nn.Module):
 
-  def __init__(self, config):
+  def __init__(self, config, env=None):
     super().__init__()
+    self.env = env
     w1 = torch.empty(
         config.num_experts,
         config.intermediate_size,
@@ -266,8 +273,9 @@ class Int8ConditionalFeedForward(nn.Module):
 
 class ConditionalFeedForward(nn.Module):
 
-  def __init__(self, config):
+  def __init__(self, config, env=None):
     super().__init__()
+    self.env = env
     # TODO(How to enable quantization?)
     self.w1 = nn.Parameter(
         torch.empty(config.num_experts, config.intermediate_size, config.dim)
@@ -308,9 +316,13 @@ class ConditionalFeedForward(nn.Module):
     # o = config.imtermediate size
     # i = config.dim
     with jax.named_scope("conditional_ff"):
-      x1 = F.silu(torch.einsum("ti,eoi -> teo", x, self.w1))
-      x3 = torch.einsum("ti, eoi-> teo", x, self.w3)
-      expert_outs = torch.einsum("teo, eio -> tei", (x1 * x3), self.w2)
+      if self.env is not None and self.env.fused_swiglu:
+        x13 = torchjax.call_jax(swiglu_kernel.fused_swiglu, x, self.w1, self.w3)
+      else:
+        x1 = F.silu(torch.einsum("ti,eoi -> teo", x, self.w1))
+        x3 = torch.einsum("ti, eoi-> teo", x, self.w3)
+        x13 = x1 * x3
+      expert_outs = torch.einsum("teo, eio -> tei", x13, self.w2)
       # e = 8; need to reduce to 2
       seq_indexes = torch.arange(seqlen).unsqueeze(1)
       return expert_outs[seq_indexes, expert_indices]
@@ -327,7 +339,7 @@ class MOEFeedForward(nn.Module):
         if env.quant_config.enable_weight_quantization
         else ConditionalFeedForward
     )
-    self.cond_ffn = CondLayer(config)
+    self.cond_ffn = CondLayer(config, env)
     self.dim = config.dim
     self.num_activated_experts = config.num_activated_experts
 
@@ -358,20 +370,34 @@ class RMSNorm(nn.Module):
     self.weight = nn.Parameter(torch.ones(dim))
 
   def _norm(self, x):
-    return x * torch.rsqrt(torch.mean(x * x, dim=-1, keepdim=True) + self.eps)
+    # Accumulate the variance in float32 only; the scaling multiply stays
+    # in the activation dtype so x is read once at its native width.
+    var = torch.mean(x.float() * x.float(), dim=-1, keepdim=True)
+    return x * torch.rsqrt(var + self.eps).type_as(x)
 
   def forward(self, x: Tensor) -> Tensor:
-    output = self._norm(x.float()).type_as(x)
+    output = self._norm(x)
     return output * self.weight
 
+  def forward_add(self, x: Tensor, residual: Tensor):
+    """Computes h = x + residual and norm(h) together so XLA fuses the
+    residual add into the norm kernel instead of re-reading h."""
+    h = x + residual
+    return h, self._norm(h) * self.weight
+
 
+@functools.lru_cache(maxsize=8)
 def precompute_freqs_cis(
     seq_len: int, n_elem: int, base: int = 10000
 ) -> Tensor:
+  # Memoized so sibling model instances in one process (e.g. per-shard
+  # replicas) share a single table; callers treat it as read-only.
   freqs = 1.0 / (
       base ** (torch.arange(0, n_elem, 2)[: (n_elem // 2)].float() / n_elem)
   )
   t = torch.arange(seq_len)
   freqs = torch.outer(t, freqs)
-  freqs_cis = torch.polar(torch.ones_like(freqs), freqs)
+  # Stacked real (cos, sin) pairs; complex64 would force complex lowering
+  # at the RoPE site.
+  freqs_cis = torch.stack((freqs.cos(), freqs.sin()), dim=-1)
   return freqs_cis
@@ -76,34 +76,17 @@ def test2():
       (batch, heads, seq, dim), device=sharding, dtype=jnp.bfloat16
   )
 
-  def insert_cache(caches_k, caches_v, pos, key, val):
-    # val is of shape b,h,d
-    return caches_k.at[:, :, pos, :].set(key.squeeze(2)), caches_v.at[
-        :, :, pos, :
-    ].set(val.squeeze(2))
-    # return caches_k.at[:, :, pos:pos+1, :].set(key), caches_v.at[:, :, pos:pos+1, :].set(val)
-
-  def insert_cache2(caches_k, caches_v, pos, key, val):
-    # val is of shape b,h,d
-    seqlen = caches_k.shape[2]
-    val = jnp.broadcast_to(val, caches_k.shape)
-    iota = jnp.arange(0, seqlen).reshape(1, 1, seqlen, 1)
-    iota = jnp.broadcast_to(iota, caches_k.shape)
-    pos = jnp.broadcast_to(pos, (seqlen,))
-    return (
-        jnp.where(iota == pos.reshape(1, 1, seqlen, 1), caches_k, key),
-        jnp.where(iota == pos.reshape(1, 1, seqlen, 1), caches_v, val),
-    )
-
+  # Only benchmark the dynamic_update_slice variant; XLA turns it into an
+  # in-place buffer update with donate_argnums. The `.at[...].set` variant
+  # lowers to scatter and the `jnp.where` variant materializes a full-size
+  # mask every step, so neither is competitive.
   # pylint: disable-next=all
   def insert_cache3(caches_k, caches_v, pos, key, val):
     return (
         jax.lax.dynamic_update_slice(caches_k, key, (0, 0, pos, 0)),
-        jax.lax.dynamic_update_slice(caches_k, key, (0, 0, pos, 0)),
+        jax.lax.dynamic_update_slice(caches_v, val, (0, 0, pos, 0)),
     )
 
-  insert_cache = jax.jit(insert_cache, donate_argnums=(0, 1))
-  insert_cache2 = jax.jit(insert_cache2, donate_argnums=(0, 1))
   insert_cache3 = jax.jit(insert_cache3, donate_argnums=(0, 1))
 
   subkey = jax.random.PRNGKey(234)
@@ -114,16 +97,6 @@ def test2():
   # pylint: disable-next=all
   j = jnp.int32(7).block_until_ready()
 
-  print("====1====")
-  print(
-      insert_cache.lower(caches_k, caches_v, j, to_insert, to_insert).as_text()
-  )
-
-  print("====2====")
-  print(
-      insert_cache2.lower(caches_k, caches_v, j, to_insert, to_insert).as_text()
-  )
-
   print("====3====")
   print(
       insert_cache3.lower(caches_k, caches_v, j, to_insert, to_insert).as_text()
@@ -131,7 +104,7 @@ def test2():
 
   rng = jax.random.PRNGKey(0)
 
-  for func in (insert_cache, insert_cache2, insert_cache3):
+  for func in (insert_cache3,):
     for _ in range(10):
       all_times = 0
       for j in range(40):
@@ -202,8 +175,6 @@ def flatten_A(x):
 # pylint: disable-next=all
 def unflatten_A(aux_data, flat_content):
   """unflatten"""
-
-  # pdb.set_trace()
   return A(*flat_content)
 
 
@@ -397,4 +368,5 @@ def test7():
   jax.profiler.stop_trace()
 
 
-test7()
+if __name__ == "__main__":
+  test7()
@@ -115,7 +115,7 @@ class LlamaE2ETest(unittest.TestCase):
     model_orig = llama_original.model
 
     state_dict = dict(model_orig.state_dict())
-    state_dict["freqs_cis"] = model_orig.freqs_cis
+    state_dict["freqs_cis"] = torch.view_as_real(model_orig.freqs_cis)
     params = self._from_torch(state_dict)
 
     output_tokens_multiple = []
@@ -183,7 +183,7 @@ class LlamaE2ETest(unittest.TestCase):
     model_orig = llama_original.model
 
     state_dict = dict(model_orig.state_dict())
-    state_dict["freqs_cis"] = model_orig.freqs_cis
+    state_dict["freqs_cis"] = torch.view_as_real(model_orig.freqs_cis)
 
     model_ours = model_exportable.Transformer(model_arg, env)
 
@@ -267,7 +267,7 @@ class LlamaE2ETest(unittest.TestCase):
     model_orig = llama_original.model
 
     state_dict = dict(model_orig.state_dict())
-    state_dict["freqs_cis"] = model_orig.freqs_cis
+    state_dict["freqs_cis"] = torch.view_as_real(model_orig.freqs_cis)
 
     model_ours = model_exportable.Transformer(model_arg, env)
 
@@ -339,7 +339,7 @@ class LlamaE2ETest(unittest.TestCase):
     model_orig = llama_original.model
 
     state_dict = dict(model_orig.state_dict())
-    state_dict["freqs_cis"] = model_orig.freqs_cis
+    state_dict["freqs_cis"] = torch.view_as_real(model_orig.freqs_cis)
 
     model_ours = model_exportable.Transformer(model_arg, env)
 
@@ -401,7 +401,7 @@ class LlamaE2ETest(unittest.TestCase):
     llama_original = LlamaOriginal.build(tokenizer_path, model_arg, seed)
     model_orig = llama_original.model
     state_dict = dict(model_orig.state_dict())
-    state_dict["freqs_cis"] = model_orig.freqs_cis
+    state_dict["freqs_cis"] = torch.view_as_real(model_orig.freqs_cis)
     model_ours = model_exportable.Transformer(model_arg, env)
     engine = PyTorchEngine(pt_model=model_ours, env=env)
     params = self._from_torch(state_dict)
@@ -476,7 +476,7 @@ class LlamaE2ETest(unittest.TestCase):
     llama_original = LlamaOriginal.build(tokenizer_path, model_arg, seed)
     model_orig = llama_original.model
     state_dict = dict(model_orig.state_dict())
-    state_dict["freqs_cis"] = model_orig.freqs_cis
+    state_dict["freqs_cis"] = torch.view_as_real(model_orig.freqs_cis)
     model_ours = model_exportable.Transformer(model_arg, env)
     engine = PyTorchEngine(pt_model=model_ours, env=env)
     params = self._from_torch(state_dict)